@@ -0,0 +1,117 @@
+"""
+Shared helpers for the realistic product scripts: server URLs, JSON codecs
+and a conditional-GET cache for the recipe catalog.
+"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+try:
+    import orjson
+
+    def loads(body: bytes) -> Any:
+        return orjson.loads(body)
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def pretty(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+except ImportError:  # orjson is optional, fall back to the stdlib
+    def loads(body: bytes) -> Any:
+        return json.loads(body)
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
+    def pretty(obj: Any) -> str:
+        return json.dumps(obj, indent=2)
+
+# Server configuration
+SERVER_URL = "http://localhost:3003"
+RECIPES_URL = f"{SERVER_URL}/recipes"
+
+RECIPES_CACHE = Path.home() / ".cache" / "zikzak" / "recipes.json"
+
+def _load_cache() -> Optional[Dict[str, Any]]:
+    """Return the cached recipes entry for RECIPES_URL, if there is one."""
+    try:
+        cached = loads(RECIPES_CACHE.read_bytes())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get("url") != RECIPES_URL or "recipes" not in cached:
+        return None
+    return cached
+
+def _store_cache(entry: Dict[str, Any]):
+    """Persist a recipes entry; the cache is only an optimisation, so failures are ignored."""
+    try:
+        RECIPES_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        # Write beside the cache and swap it in so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=RECIPES_CACHE.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(dumps(entry))
+            os.replace(tmp_path, RECIPES_CACHE)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        pass
+
+class RecipeFetch:
+    """State for one conditional GET of the recipe catalog; callers supply the transport."""
+
+    def __init__(self):
+        self._cached = _load_cache()
+        self.status: Optional[int] = None
+        self.recipes: Optional[Dict[str, Any]] = None
+
+    def request_headers(self) -> Dict[str, str]:
+        """Validators for the next GET, taken from the cache entry loaded up front."""
+        headers: Dict[str, str] = {}
+        if self._cached:
+            if self._cached.get("etag"):
+                headers["If-None-Match"] = self._cached["etag"]
+            if self._cached.get("last_modified"):
+                headers["If-Modified-Since"] = self._cached["last_modified"]
+        return headers
+
+    def resolve(self, status: int, headers: Mapping[str, str], body: bytes) -> bool:
+        """Record a response; False means repeat the GET (now without validators)."""
+        self.status = status
+        if status == 304:
+            # The entry was loaded before the GET, so the body served is the one that was validated
+            if self._cached is None:
+                return True
+            etag = headers.get("ETag")
+            if etag is None or etag == self._cached.get("etag"):
+                self.recipes = self._cached["recipes"]
+                return True
+            # The 304 names a different version than the cached body; fetch it in full
+            self._cached = None
+            return False
+        if status != 200:
+            return True
+
+        self.recipes = loads(body)
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if etag or last_modified:
+            _store_cache({"url": RECIPES_URL, "etag": etag, "last_modified": last_modified, "recipes": self.recipes})
+        return True
+
+def fetch_recipes(session) -> Tuple[int, Optional[Dict[str, Any]]]:
+    """Fetch (status, recipe catalog) with a requests session, reusing the cache on 304."""
+    fetch = RecipeFetch()
+    while True:
+        response = session.get(RECIPES_URL, headers=fetch.request_headers())
+        if fetch.resolve(response.status_code, response.headers, response.content):
+            return fetch.status, fetch.recipes
+
+def realistic_recipe_names(recipes: Mapping[str, Any]) -> List[str]:
+    """Names of the realistic product recipes in the catalog."""
+    return [name for name in recipes if "realistic" in name]
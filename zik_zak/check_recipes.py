@@ -3,22 +3,27 @@
 Quick health check to verify realistic product recipes are loaded.
 """
 
+import sys
+
 import requests
-import json
+from requests.adapters import HTTPAdapter
+
+from _common import fetch_recipes, realistic_recipe_names
 
-SERVER_URL = "http://localhost:3003"
+# Reuse one keep-alive connection instead of reconnecting per request
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+SESSION.headers["Connection"] = "keep-alive"
 
 def check_recipes():
     """Check if our realistic product recipes are loaded."""
     try:
-        response = requests.get(f"{SERVER_URL}/recipes")
-        if response.status_code == 200:
-            recipes = response.json()
-
+        status, recipes = fetch_recipes(SESSION)
+        if recipes is not None:
             print("🦖 Recipe Status Check")
             print("=" * 30)
 
-            realistic_recipes = [name for name in recipes.keys() if "realistic" in name]
+            realistic_recipes = realistic_recipe_names(recipes)
 
             if realistic_recipes:
                 print("✅ Realistic product recipes found:")
@@ -39,7 +44,7 @@ def check_recipes():
                 print("   🔄 Stop the server (Ctrl+C) and run: cargo run")
                 return False
         else:
-            print(f"❌ Failed to connect: {response.status_code}")
+            print(f"❌ Failed to connect: {status}")
             return False
 
     except requests.exceptions.ConnectionError:
@@ -50,4 +55,5 @@ def check_recipes():
         return False
 
 if __name__ == "__main__":
-    check_recipes()
+    # Exit non-zero so run_tests.sh stops here instead of retrying against a dead server
+    sys.exit(0 if check_recipes() else 1)
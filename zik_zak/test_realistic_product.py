@@ -3,201 +3,303 @@
 Test script for realistic product recipes using the comprehensive e-commerce product schema.
 """
 
-import json
-import requests
+import asyncio
+import io
+import random
+import sys
 import time
-from typing import Dict, Any
-
-# Server configuration
-SERVER_URL = "http://localhost:3003"
-
-def test_realistic_product_recipes():
-    """Test the comprehensive realistic product recipes."""
-
-    print("🦖 Testing Realistic Product Recipes")
-    print("=" * 50)
-
-    # Sample product data based on the MSI laptop from the schema
-    product_data = {
-        "id": "prod_laptop_gaming_001",
-        "sku": "MSI-GP66-RTX3070-001",
-        "name": "MSI GP66 Leopard Gaming Laptop - RTX 3070, Intel i7-11800H, 16GB RAM, 1TB SSD",
-        "description": "Experience next-level gaming performance with the MSI GP66 Leopard. Featuring the latest NVIDIA GeForce RTX 3070 graphics card and Intel Core i7-11800H processor, this laptop delivers exceptional frame rates and smooth gameplay.",
-        "short_description": "High-performance gaming laptop with RTX 3070 and i7 processor",
-        "price": "189999",  # Price in cents to avoid decimals
-        "original_price": "219999",
-        "cost_price": "145000",
-        "currency": "USD",
-        "brand": "MSI",
-        "categories": "Electronics,Computers,Laptops,Gaming Laptops",
-        "tags": "gaming,laptop,rtx,nvidia,intel,high-performance,144hz,rgb",
-        "weight": "240",  # Weight in 100g units (2.4kg = 240)
-        "inventory_quantity": "45",
-        "status": "active",
-        "visibility": "public"
-    }
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Any, Mapping, Optional, Tuple, TypeVar
+
+import aiohttp
+import ijson
+
+from _common import (
+    SERVER_URL, RECIPES_URL, dumps, loads, pretty,
+    RecipeFetch, realistic_recipe_names,
+)
+
+# Server endpoints
+CREATE_URL = f"{SERVER_URL}/recipe/create_realistic_product"
+READ_URL = f"{SERVER_URL}/recipe/read_realistic_product"
+TX_URL = f"{SERVER_URL}/transactions"
+
+# Request bodies are pre-encoded with dumps, so the POSTs declare their content type
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Retry policy for transient failures of idempotent requests
+# (connection errors, timeouts, bodies cut off mid-stream, 5xx)
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.05
+_TRANSIENT_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+T = TypeVar("T")
+
+async def _backoff(attempt: int):
+    """Sleep with full jitter: a random delay up to the exponential bound for this attempt."""
+    await asyncio.sleep(random.uniform(0, 2 ** attempt * RETRY_BASE_DELAY))
+
+async def _send(
+    session: aiohttp.ClientSession, method: str, url: str,
+    consume: Callable[[aiohttp.ClientResponse], Awaitable[T]],
+    *, idempotent: bool = True, **kwargs
+) -> T:
+    """Issue a request, retrying transient failures, and return what consume makes of the response."""
+    # Once sent, a non-idempotent create may already be applied, so only retry failed connects
+    retry_on = _TRANSIENT_ERRORS if idempotent else (aiohttp.ClientConnectorError,)
+    for attempt in range(RETRY_ATTEMPTS):
+        last_attempt = attempt == RETRY_ATTEMPTS - 1
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                if response.status < 500 or not idempotent or last_attempt:
+                    return await consume(response)
+        except retry_on:
+            if last_attempt:
+                raise
+        await _backoff(attempt)
+
+async def _read_response(response: aiohttp.ClientResponse) -> Tuple[int, Mapping[str, str], bytes]:
+    """Read the whole response into (status, headers, body)."""
+    return response.status, response.headers, await response.read()
+
+async def _request(
+    session: aiohttp.ClientSession, method: str, url: str, *, idempotent: bool = True, **kwargs
+) -> Tuple[int, Mapping[str, str], bytes]:
+    """Issue a request and return its status code, headers and raw body."""
+    return await _send(session, method, url, _read_response, idempotent=idempotent, **kwargs)
+
+async def _fetch(
+    session: aiohttp.ClientSession, method: str, url: str, *, idempotent: bool = True, **kwargs
+) -> Tuple[int, bytes]:
+    """Issue a request and return its status code and raw body."""
+    status, _, body = await _request(session, method, url, idempotent=idempotent, **kwargs)
+    return status, body
+
+async def _fetch_recipes(session: aiohttp.ClientSession) -> Tuple[int, Optional[Dict[str, Any]]]:
+    """Async counterpart of _common.fetch_recipes over the aiohttp session."""
+    fetch = RecipeFetch()
+    while True:
+        status, headers, body = await _request(session, "GET", RECIPES_URL, headers=fetch.request_headers())
+        if fetch.resolve(status, headers, body):
+            return fetch.status, fetch.recipes
+
+async def _wait_for_read(
+    session: aiohttp.ClientSession, product_id: str, deadline_ms: float = 100
+) -> Tuple[int, bytes]:
+    """Poll the read recipe until the product is visible or the deadline passes, returning the last read."""
+    delay = 0.002
+    start = time.monotonic()
+    # Single-attempt polls: the retry policy's backoff would overrun the deadline
+    while True:
+        try:
+            async with session.post(READ_URL, data=dumps({"id": product_id}), headers=JSON_HEADERS) as response:
+                status, body = response.status, await response.read()
+        except _TRANSIENT_ERRORS:
+            # A dropped poll is treated like a write that is not visible yet
+            if (time.monotonic() - start) * 1000 >= deadline_ms:
+                raise
+        else:
+            if status == 200 and loads(body).get("name"):
+                return status, body
+            if (time.monotonic() - start) * 1000 >= deadline_ms:
+                return status, body
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.02)
+
+async def _scan_product_transactions(
+    session: aiohttp.ClientSession, product_id: str, keep: int = 5
+) -> Tuple[int, int, int, Deque[Dict[str, Any]]]:
+    """Stream the transaction log into (status, total, matched, last `keep` matches for product_id)."""
+    async def scan(response: aiohttp.ClientResponse) -> Tuple[int, int, int, Deque[Dict[str, Any]]]:
+        # A retry re-reads the log from the start, so the tallies are fresh on every call
+        recent: Deque[Dict[str, Any]] = deque(maxlen=keep)
+        total = matched = 0
+        if response.status == 200:
+            async for tx in ijson.items(response.content, "item", use_float=True):
+                total += 1
+                from_account = tx.get("from_account", "")
+                to_account = tx.get("to_account", "")
+                # Exact account matches are the cheap common case; fall back to substring search
+                if (product_id == from_account or product_id == to_account or
+                        product_id in from_account or product_id in to_account):
+                    matched += 1
+                    recent.append(tx)
+        return response.status, total, matched, recent
+
+    return await _send(session, "GET", TX_URL, scan)
+
+# Sample product data based on the MSI laptop from the schema
+LAPTOP_DATA = {
+    "id": "prod_laptop_gaming_001",
+    "sku": "MSI-GP66-RTX3070-001",
+    "name": "MSI GP66 Leopard Gaming Laptop - RTX 3070, Intel i7-11800H, 16GB RAM, 1TB SSD",
+    "description": "Experience next-level gaming performance with the MSI GP66 Leopard. Featuring the latest NVIDIA GeForce RTX 3070 graphics card and Intel Core i7-11800H processor, this laptop delivers exceptional frame rates and smooth gameplay.",
+    "short_description": "High-performance gaming laptop with RTX 3070 and i7 processor",
+    "price": "189999",  # Price in cents to avoid decimals
+    "original_price": "219999",
+    "cost_price": "145000",
+    "currency": "USD",
+    "brand": "MSI",
+    "categories": "Electronics,Computers,Laptops,Gaming Laptops",
+    "tags": "gaming,laptop,rtx,nvidia,intel,high-performance,144hz,rgb",
+    "weight": "240",  # Weight in 100g units (2.4kg = 240)
+    "inventory_quantity": "45",
+    "status": "active",
+    "visibility": "public"
+}
+
+# iPhone data to ensure the system handles multiple products
+IPHONE_DATA = {
+    "id": "prod_smartphone_flagship_002",
+    "sku": "AAPL-IPHONE15-PRO-256",
+    "name": "Apple iPhone 15 Pro - 256GB, Natural Titanium",
+    "description": "The most advanced iPhone yet, featuring the powerful A17 Pro chip and pro camera system. Built with aerospace-grade titanium for incredible durability and a premium feel.",
+    "short_description": "Premium flagship smartphone with A17 Pro chip and pro camera system",
+    "price": "119999",  # $1199.99 in cents
+    "original_price": "119999",
+    "cost_price": "85000",  # $850.00 in cents
+    "currency": "USD",
+    "brand": "Apple",
+    "categories": "Electronics,Mobile Phones,Smartphones,Premium Phones",
+    "tags": "iphone,apple,smartphone,premium,titanium,pro,camera,5g",
+    "weight": "19",  # 187g rounded to 19 (10g units)
+    "inventory_quantity": "128",
+    "status": "active",
+    "visibility": "public"
+}
+
+PRODUCTS = [LAPTOP_DATA, IPHONE_DATA]
+
+async def run_product_test(session: aiohttp.ClientSession, product_data: Dict[str, str]) -> Tuple[bool, str]:
+    """Test one realistic product, returning whether it passed and its buffered output."""
+    out = io.StringIO()
+    passed = await _check_product(session, product_data, out)
+    return passed, out.getvalue()
+
+async def _check_product(session: aiohttp.ClientSession, product_data: Dict[str, str], out: io.StringIO) -> bool:
+    """Create, read back and audit the transactions of one realistic product."""
+
+    print("\n" + "=" * 50, file=out)
+    print(f"🦖 Testing {product_data['name']}", file=out)
+    print("=" * 50, file=out)
 
     try:
         # Test 1: Create realistic product
-        print("📝 Test 1: Creating realistic product...")
-
-        create_response = requests.post(
-            f"{SERVER_URL}/recipe/create_realistic_product",
-            json=product_data
+        print("📝 Test 1: Creating realistic product...", file=out)
+
+        create_status, create_body = await _fetch(
+            session, "POST",
+            CREATE_URL,
+            idempotent=False,
+            data=dumps(product_data),
+            headers=JSON_HEADERS
         )
 
-        if create_response.status_code == 200:
-            print("✅ Product created successfully!")
-            result = create_response.json()
-            print(f"   Result: {json.dumps(result, indent=2)}")
+        if create_status == 200:
+            print("✅ Product created successfully!", file=out)
+            result = loads(create_body)
+            print(f"   Result: {pretty(result)}", file=out)
         else:
-            print(f"❌ Failed to create product: {create_response.status_code}")
-            print(f"   Error: {create_response.text}")
+            print(f"❌ Failed to create product: {create_status}", file=out)
+            print(f"   Error: {create_body.decode()}", file=out)
             return False
 
-        # Small delay to ensure consistency
-        time.sleep(0.1)
-
         # Test 2: Read realistic product
-        print("\n📖 Test 2: Reading realistic product...")
+        print("\n📖 Test 2: Reading realistic product...", file=out)
 
-        read_response = requests.post(
-            f"{SERVER_URL}/recipe/read_realistic_product",
-            json={"id": product_data["id"]}
-        )
+        read_status, read_body = await _wait_for_read(session, product_data["id"])
 
-        if read_response.status_code == 200:
-            print("✅ Product read successfully!")
-            result = read_response.json()
-            print(f"   Retrieved product: {json.dumps(result, indent=2)}")
+        if read_status == 200:
+            print("✅ Product read successfully!", file=out)
+            result = loads(read_body)
+            print(f"   Retrieved product: {pretty(result)}", file=out)
 
             # Validate some key fields
             if result.get("name") and result.get("price") and result.get("brand"):
-                print("✅ Key fields validated successfully!")
+                print("✅ Key fields validated successfully!", file=out)
+                print(f"   Brand: {result['brand']}", file=out)
+                print(f"   Price: ${int(result['price']) / 100:.2f}", file=out)
             else:
-                print("⚠️  Some key fields are missing or empty")
+                print("⚠️  Some key fields are missing or empty", file=out)
         else:
-            print(f"❌ Failed to read product: {read_response.status_code}")
-            print(f"   Error: {read_response.text}")
+            print(f"❌ Failed to read product: {read_status}", file=out)
+            print(f"   Error: {read_body.decode()}", file=out)
             return False
 
-        # Test 3: List all recipes to verify our new ones are there
-        print("\n📋 Test 3: Listing all available recipes...")
-
-        list_response = requests.get(f"{SERVER_URL}/recipes")
+        # Test 3: Check transaction history
+        print("\n🔍 Test 3: Checking transaction history...", file=out)
 
-        if list_response.status_code == 200:
-            recipes = list_response.json()
-            print("✅ Available recipes:")
-            for name, info in recipes.items():
-                if "realistic" in name:
-                    print(f"   🎯 {name}: {info.get('description', 'No description')}")
-                    print(f"      Inputs: {info.get('inputs', [])}")
-                    print(f"      Operations: {info.get('operations_count', 0)}")
-        else:
-            print(f"❌ Failed to list recipes: {list_response.status_code}")
-
-        # Test 4: Check transaction history
-        print("\n🔍 Test 4: Checking transaction history...")
-
-        history_response = requests.get(f"{SERVER_URL}/transactions")
+        # Only scan once the read has confirmed the write is visible
+        history_status, history_total, history_matched, recent_transactions = (
+            await _scan_product_transactions(session, product_data["id"])
+        )
 
-        if history_response.status_code == 200:
-            history = history_response.json()
-            print(f"✅ Transaction history contains {len(history)} transactions")
+        if history_status == 200:
+            print(f"✅ Transaction history contains {history_total} transactions", file=out)
 
             # Show recent transactions related to our product
-            product_transactions = [
-                tx for tx in history
-                if product_data["id"] in tx.get("from_account", "") or
-                   product_data["id"] in tx.get("to_account", "")
-            ]
-
-            print(f"   📊 Found {len(product_transactions)} transactions for our product:")
-            for i, tx in enumerate(product_transactions[-5:]):  # Show last 5
-                print(f"      {i+1}. {tx['from_account']} → {tx['to_account']} ({tx['amount']})")
+            print(f"   📊 Found {history_matched} transactions for our product:", file=out)
+            for i, tx in enumerate(recent_transactions):  # Last 5 only
+                print(f"      {i+1}. {tx['from_account']} → {tx['to_account']} ({tx['amount']})", file=out)
                 if tx.get('metadata'):
-                    print(f"         Metadata: {tx['metadata']}")
+                    print(f"         Metadata: {tx['metadata']}", file=out)
         else:
-            print(f"❌ Failed to get history: {history_response.status_code}")
+            print(f"❌ Failed to get history: {history_status}", file=out)
 
-        print("\n🎉 All tests completed successfully!")
+        print(f"\n🎉 All tests completed successfully for {product_data['id']}!", file=out)
         return True
 
-    except requests.exceptions.ConnectionError:
-        print("❌ Connection error: Make sure the Pure Accounting Server is running on port 3003")
-        print("   Start it with: cd tensorzero/pure-accounting-server && cargo run")
+    except aiohttp.ClientConnectionError:
+        print("❌ Connection error: Make sure the Pure Accounting Server is running on port 3003", file=out)
+        print("   Start it with: cd tensorzero/pure-accounting-server && cargo run", file=out)
         return False
     except Exception as e:
-        print(f"❌ Unexpected error: {e}")
+        print(f"❌ Unexpected error: {e}", file=out)
         return False
 
-def test_second_product():
-    """Test with the iPhone data to ensure the system handles multiple products."""
-
-    print("\n" + "=" * 50)
-    print("📱 Testing with iPhone 15 Pro data...")
-
-    iphone_data = {
-        "id": "prod_smartphone_flagship_002",
-        "sku": "AAPL-IPHONE15-PRO-256",
-        "name": "Apple iPhone 15 Pro - 256GB, Natural Titanium",
-        "description": "The most advanced iPhone yet, featuring the powerful A17 Pro chip and pro camera system. Built with aerospace-grade titanium for incredible durability and a premium feel.",
-        "short_description": "Premium flagship smartphone with A17 Pro chip and pro camera system",
-        "price": "119999",  # $1199.99 in cents
-        "original_price": "119999",
-        "cost_price": "85000",  # $850.00 in cents
-        "currency": "USD",
-        "brand": "Apple",
-        "categories": "Electronics,Mobile Phones,Smartphones,Premium Phones",
-        "tags": "iphone,apple,smartphone,premium,titanium,pro,camera,5g",
-        "weight": "19",  # 187g rounded to 19 (10g units)
-        "inventory_quantity": "128",
-        "status": "active",
-        "visibility": "public"
-    }
+async def list_realistic_recipes(session: aiohttp.ClientSession) -> str:
+    """List the realistic product recipes to verify our new ones are there, returning the output."""
+    out = io.StringIO()
+    print("\n📋 Listing all available recipes...", file=out)
 
     try:
-        # Create iPhone
-        create_response = requests.post(
-            f"{SERVER_URL}/recipe/create_realistic_product",
-            json=iphone_data
+        list_status, recipes = await _fetch_recipes(session)
+    except Exception as e:
+        print(f"❌ Failed to list recipes: {e}", file=out)
+        return out.getvalue()
+
+    if recipes is not None:
+        print("✅ Available recipes:", file=out)
+        for name in realistic_recipe_names(recipes):
+            info = recipes[name]
+            print(f"   🎯 {name}: {info.get('description', 'No description')}", file=out)
+            print(f"      Inputs: {info.get('inputs', [])}", file=out)
+            print(f"      Operations: {info.get('operations_count', 0)}", file=out)
+    else:
+        print(f"❌ Failed to list recipes: {list_status}", file=out)
+    return out.getvalue()
+
+async def main() -> bool:
+    """Run every product test concurrently over one shared connection pool."""
+    connector = aiohttp.TCPConnector(limit=8, keepalive_timeout=30)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        # The recipe catalog is product independent, so it is only listed once
+        recipes_output, *results = await asyncio.gather(
+            list_realistic_recipes(session),
+            *(run_product_test(session, product) for product in PRODUCTS),
         )
 
-        if create_response.status_code == 200:
-            print("✅ iPhone created successfully!")
-
-            # Read it back
-            read_response = requests.post(
-                f"{SERVER_URL}/recipe/read_realistic_product",
-                json={"id": iphone_data["id"]}
-            )
-
-            if read_response.status_code == 200:
-                result = read_response.json()
-                print(f"✅ iPhone data retrieved: {result.get('name', 'Unknown')}")
-                print(f"   Brand: {result.get('brand', 'Unknown')}")
-                print(f"   Price: ${int(result.get('price', 0)) / 100:.2f}")
-                return True
-            else:
-                print(f"❌ Failed to read iPhone: {read_response.text}")
-                return False
-        else:
-            print(f"❌ Failed to create iPhone: {create_response.text}")
-            return False
-
-    except Exception as e:
-        print(f"❌ Error testing iPhone: {e}")
-        return False
+    # Write everything at once in a fixed order, whichever test finished first
+    sys.stdout.write(recipes_output + "".join(output for _, output in results))
+    sys.stdout.flush()
+    return all(passed for passed, _ in results)
 
 if __name__ == "__main__":
     print("🦖 Pure Accounting - Realistic Product Recipe Test")
     print("Make sure the server is running: cargo run")
     print()
 
-    success = test_realistic_product_recipes()
-    if success:
-        success = test_second_product()
+    success = asyncio.run(main())
 
     if success:
         print("\n🎉 All tests passed! The realistic product recipes are working correctly.")